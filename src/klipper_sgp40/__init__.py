@@ -11,10 +11,14 @@ from logging import ERROR, WARNING
 from struct import unpack_from
 
 from .. import bus  # type: ignore
+from .exposure import ExposureSummary
 from .gia import GasIndexAlgorithm
+from .trend import RollingWindow
+from .trigger import VocTrigger
 
 SGP40_CHIP_ADDR = 0x59
 SGP40_WORD_LEN = 2
+TREND_WINDOWS = (("1m", 60.0), ("5m", 300.0), ("15m", 900.0))
 
 
 class _SafeTransferCmd:
@@ -91,6 +95,80 @@ def _humidity_to_ticks(humidity):
     return data + [crc]
 
 
+class _SyncGroup:
+    # Samples a set of sensors in the same timer tick so their measurements
+    # are time aligned, and keeps their VOC index on a comparable scale by
+    # raising each reading sensor's variance to the largest in the group.
+    def __init__(self, printer, name=None):
+        self.printer = printer
+        self.reactor = printer.get_reactor()
+        self.name = name
+        self.members = []
+        self.sampling_interval = None
+        self._timer = None
+
+    def add_member(self, sensor):
+        interval = sensor.get_report_time_delta()
+        if self.sampling_interval is None:
+            self.sampling_interval = interval
+        elif interval != self.sampling_interval:
+            raise self.printer.config_error(
+                "SGP40 sync group '%s' requires the same sampling_interval"
+                " on all sensors" % (self.name,)
+            )
+        self.members.append(sensor)
+        sensor._group = self
+
+    def merge(self, other):
+        if other is self:
+            return
+        for sensor in other.members:
+            self.add_member(sensor)
+        other.members = []
+
+    def start(self):
+        if self._timer is None:
+            self._timer = self.reactor.register_timer(
+                self._handle_step, self.reactor.NOW
+            )
+
+    def _handle_step(self, eventtime):
+        sensors = [s for s in self.members if s._is_ready(eventtime)]
+        readings = []
+        for sensor in sensors:
+            sensor._update_environment(eventtime)
+            if sensor._measuring:
+                raw = sensor._read_measurement()
+                if raw is not None:
+                    readings.append((sensor, raw))
+
+        if readings:
+            # The floor is taken once per tick from the members that read a
+            # measurement; a sensor that is backing off, recovering or not yet
+            # initialized has a stale variance.
+            gias = [sensor._gia for sensor, _ in readings]
+            widest = max(gias, key=lambda gia: gia.get_states()[1])
+            for sensor, raw in readings:
+                if len(gias) > 1:
+                    sensor._gia.apply_variance_floor(widest)
+                sensor._process(eventtime, raw)
+            self._wait_ms(20)
+
+        # Sensors that failed to read are backing off and no longer ready.
+        sensors = [s for s in sensors if s._is_ready(eventtime)]
+        for sensor in sensors:
+            sensor._start_measurement()
+
+        measured_time = self.reactor.monotonic()
+        for sensor in sensors:
+            if sensor._is_ready(eventtime):
+                sensor._end_step(measured_time)
+        return measured_time + self.sampling_interval
+
+    def _wait_ms(self, ms):
+        self.reactor.pause(self.reactor.monotonic() + ms / 1000)
+
+
 class SGP40:
     def __init__(self, config):
         self.printer = config.get_printer()
@@ -106,11 +184,17 @@ class SGP40:
         self.heater_names = config.getlist("heater", ("extruder",))
         self.heater_temp = config.getfloat("heater_temp", 75.0)
         self._heaters = []
+        self._print_stats = None
+        self._printing = False
+        self.exposure = ExposureSummary(
+            config.getint("exposure_threshold", 250, minval=0, maxval=500)
+        )
 
         self.raw = self.voc = self.temp = self.humidity = 0
         self.min_temp = self.max_temp = 0
-        self.step_timer = None
+        self._initialized = False
         self._measuring = False
+        self._retry_time = 0.0
         self._ref_sensors = []
 
         mean = config.getfloat("voc_mean", None)
@@ -122,14 +206,47 @@ class SGP40:
         if mean is not None and stddev is not None:
             self._gia.set_states(mean, stddev)
 
-        self._sync_peer_name = config.get("sync_with", None)
-        self._sync_peer = None
+        self.publish_deadband = config.getfloat("publish_deadband", 0.0, minval=0.0)
+        self.publish_deadband_ratio = config.getfloat(
+            "publish_deadband_ratio", 0.0, minval=0.0
+        )
+        self.publish_interval = config.getfloat("publish_interval", 0.0, minval=0.0)
+        self.publish_heartbeat = config.getfloat("publish_heartbeat", 0.0, minval=0.0)
+        self._trends = {
+            label: RollingWindow(duration) for label, duration in TREND_WINDOWS
+        }
+        self.trend_interval = config.getfloat(
+            "trend_interval", 10.0, minval=sampling_interval
+        )
+        self._trend_time = None
+        self._trigger = None
+        if config.get("trigger_rising", None) is not None:
+            self._trigger = VocTrigger(config, self.name)
+        self._force_publish = False
+        self._published_time = None
+        self._published_voc = 0
+        self._status = self._build_status()
+
+        group_name = config.get("sync_group", None)
+        # Deprecated pairwise option, resolved into the peer's group at connect.
+        self._sync_with = config.get("sync_with", None)
+        if group_name is not None and self._sync_with is not None:
+            raise self.printer.config_error(
+                "SGP40 %s: sync_group and sync_with cannot both be set" % self.name
+            )
+        psgp40 = self.printer.load_object(config, "sgp40")
+        if group_name is None:
+            group = _SyncGroup(self.printer, self.name)
+        else:
+            group = psgp40.lookup_group(group_name)
+        group.add_member(self)
 
         self.printer.add_object("sgp40 " + self.name, self)
         if self.printer.get_start_args().get("debugoutput") is not None:
             return
 
-        self.printer.register_event_handler("klippy:connect", self._handle_connect)
+        # Sensors are connected and initialized together by PrinterSGP40.
+        psgp40.add_sensor(self)
         self.printer.register_event_handler("klippy:ready", self._handle_ready)
 
         self._register_commands()
@@ -174,6 +291,38 @@ class SGP40:
             "Active" if self._gia.calibrating else "Inactive"
         )
 
+        for label, window in self._trends.items():
+            trend = window.get_status()
+            response += "\nVOC %s: mean=%.1f min=%d max=%d slope=%.2f/min" % (
+                label,
+                trend["mean"],
+                trend["min"],
+                trend["max"],
+                trend["slope"],
+            )
+
+        if self._trigger is not None:
+            response += "\nTrigger: %s" % (
+                "Active" if self._trigger.active else "Inactive"
+            )
+
+        exposure = self.exposure.get_status()
+        response += (
+            "\nPrint exposure%s: peak=%d p50=%d p95=%d p99=%d"
+            "\nTime above %d: %.1f s\nArea: %.1f over %.1f s"
+            % (
+                "" if self._printing else " (last print)",
+                exposure["peak"],
+                exposure["p50"],
+                exposure["p95"],
+                exposure["p99"],
+                self.exposure.threshold,
+                exposure["time_above_threshold"],
+                exposure["area"],
+                exposure["duration"],
+            )
+        )
+
         gcmd.respond_info(response)
 
     def calibrate_gcode(self, gcmd):
@@ -207,15 +356,8 @@ class SGP40:
 
         if hasattr(sensor, "i2c"):
             self._patch_i2c(sensor.i2c)
-            if hasattr(sensor, "sample_timer") and sensor not in self._ref_sensors:
-                self._ref_sensors.append(sensor)
 
     def _handle_connect(self):
-        if self._sync_peer_name:
-            self._sync_peer = self.printer.lookup_object(
-                "sgp40 " + self._sync_peer_name
-            )
-
         if self.temp_sensor:
             self._check_ref_sensor(self.temp_sensor, "temperature")
         if self.humidity_sensor:
@@ -223,13 +365,6 @@ class SGP40:
             self._check_ref_sensor(self.humidity_sensor)
 
         self._patch_i2c(self.i2c)
-        # Intentionally no try/except: the sensor must respond at startup.
-        # Transient NACKs during the measurement loop are handled in
-        # _handle_step, but a sensor that is absent or unresponsive at connect
-        # time should be a hard failure.
-        self._init_sgp40()
-
-        self.reactor.update_timer(self.step_timer, self.reactor.NOW)
 
     def _patch_i2c(self, i2c):
         # bus.py's i2c_transfer() calls invoke_shutdown() on any non-SUCCESS
@@ -257,6 +392,16 @@ class SGP40:
     def _handle_ready(self):
         pheaters = self.printer.lookup_object("heaters")
         self._heaters = [pheaters.lookup_heater(n) for n in self.heater_names]
+        self._print_stats = self.printer.lookup_object("print_stats", None)
+
+        # BME280 creates its sample timer in its own connect handler, which
+        # may run after PrinterSGP40's, so look for it once the printer is ready.
+        for name in (self.temp_sensor, self.humidity_sensor):
+            if not name:
+                continue
+            sensor = self.printer.lookup_object(name)
+            if hasattr(sensor, "sample_timer") and sensor not in self._ref_sensors:
+                self._ref_sensors.append(sensor)
 
     def setup_minmax(self, min_temp, max_temp):
         self.min_temp = min_temp
@@ -268,18 +413,20 @@ class SGP40:
     def get_report_time_delta(self):
         return self._gia.sampling_interval
 
-    def _init_sgp40(self):
+    def _stop_heater(self):
         self.i2c.i2c_write(HEATER_OFF_CMD)
-        self._wait_ms(50)
 
-        # Self test
+    def _start_self_test(self):
         self.i2c.i2c_write(SELF_TEST_CMD)
-        self._wait_ms(500)
+
+    def _check_self_test(self):
         response = self._read()
         if response[0] != 0xD400:
             self._log(ERROR, "Self test error")
 
-        self.step_timer = self.reactor.register_timer(self._handle_step)
+    def _start(self):
+        self._initialized = True
+        self._group.start()
 
     def _is_hot(self, eventtime):
         for heater in self._heaters:
@@ -289,7 +436,26 @@ class SGP40:
         else:
             return False
 
-    def _handle_step(self, eventtime):
+    def _update_print_state(self, eventtime):
+        # print_stats does not send events on job start or end, so follow its
+        # state here.  A new summary starts with each print and the last one
+        # stays available until the next print starts.
+        if self._print_stats is None:
+            return
+        state = self._print_stats.get_status(eventtime)["state"]
+        printing = state in ("printing", "paused")
+        if printing and not self._printing:
+            self.exposure.reset()
+        if printing != self._printing:
+            # Publish the summary at the start and end of a print even if the
+            # VOC index is inside the publish deadband.
+            self._force_publish = True
+        self._printing = printing
+
+    def _is_ready(self, eventtime):
+        return self._initialized and eventtime >= self._retry_time
+
+    def _update_environment(self, eventtime):
         self._gia.calibrating = not self._is_hot(eventtime)
 
         if self.temp_sensor:
@@ -320,34 +486,78 @@ class SGP40:
                     self.reactor.monotonic() + self._gia.sampling_interval,
                 )
 
+    def _read_measurement(self):
+        try:
+            return self._read()[0]
+        except Exception:
+            self._step_failed()
+            return None
+
+    def _process(self, eventtime, raw):
+        self.voc = self._gia.process(raw)
+        self.raw = self._gia.raw
+        if self.voc:
+            # Zero means the gas index algorithm has not warmed up yet.
+            for window in self._trends.values():
+                window.update(eventtime, self.voc)
+            if self._printing:
+                self.exposure.update(eventtime, self.voc)
+        if self._trigger is not None and self._trigger.update(eventtime, self.voc):
+            self._force_publish = True
+
+    def _start_measurement(self):
         cmd = (
             MEASURE_RAW_CMD_PREFIX
             + _humidity_to_ticks(self.humidity)
             + _temperature_to_ticks(self.temp)
         )
         try:
-            if self._measuring:
-                response = self._read()
-                raw = response[0]
-                if self._sync_peer is not None:
-                    self._gia.apply_variance_floor(self._sync_peer._gia)
-                self.voc = self._gia.process(raw)
-                self.raw = self._gia.raw
-                self._wait_ms(20)
             self.i2c.i2c_write(cmd)
             self._measuring = True
         except Exception:
-            logging.exception("SGP40 %s: Error during measurement step" % self.name)
-            self.temp = self.humidity = 0.0
-            self._measuring = False
-            return self.reactor.monotonic() + self._gia.sampling_interval * 5
+            self._step_failed()
 
-        measured_time = self.reactor.monotonic()
-        self._callback(self.mcu.estimated_print_time(measured_time), self.voc)
-        return measured_time + self._gia.sampling_interval
+    def _step_failed(self):
+        logging.exception("SGP40 %s: Error during measurement step" % self.name)
+        self.temp = self.humidity = 0.0
+        self._measuring = False
+        self._retry_time = self.reactor.monotonic() + self._gia.sampling_interval * 5
+        self._status = self._build_status()
+
+    def _end_step(self, measured_time):
+        self._update_print_state(measured_time)
+        if self._force_publish or self._should_publish(measured_time):
+            self._force_publish = False
+            self._publish(measured_time)
+        elif measured_time - self._trend_time >= self.trend_interval:
+            # Trends keep changing while the VOC index sits inside the
+            # deadband, so they are refreshed on their own schedule.
+            self._trend_time = measured_time
+            self._status = dict(self._status, **self._trend_status())
+
+    def _should_publish(self, eventtime):
+        # Sampling and the gas index algorithm run on every step; only the
+        # values handed to temperature_sensor and reported by get_status are
+        # limited, so clients are not sent updates that carry no information.
+        if self._published_time is None:
+            return True
+        elapsed = eventtime - self._published_time
+        if self.publish_heartbeat and elapsed >= self.publish_heartbeat:
+            return True
+        if elapsed < self.publish_interval:
+            return False
+        deadband = max(
+            self.publish_deadband,
+            self.publish_deadband_ratio * abs(self._published_voc),
+        )
+        return abs(self.voc - self._published_voc) >= deadband
 
-    def _wait_ms(self, ms):
-        self.reactor.pause(self.reactor.monotonic() + ms / 1000)
+    def _publish(self, eventtime):
+        self._published_time = eventtime
+        self._published_voc = self.voc
+        self._trend_time = eventtime
+        self._status = self._build_status()
+        self._callback(self.mcu.estimated_print_time(eventtime), self.voc)
 
     def _read(self, count=1):
         chunk_size = SGP40_WORD_LEN + 1
@@ -366,16 +576,126 @@ class SGP40:
     def _log(self, level, msg):
         logging.log(level, "SGP40 %s: %s" % (self.name, msg))
 
-    def get_status(self, eventtime):
+    def _build_status(self):
         return {
             "temperature": self.temp,
             "humidity": self.humidity,
             "gas_raw": self.raw,
             "gas": self.voc,
+            "exposure": self.exposure.get_status(),
+            "trigger": self._trigger is not None and self._trigger.active,
+            **self._trend_status(),
         }
 
+    def _trend_status(self):
+        return {
+            "trend_" + label: window.get_status()
+            for label, window in self._trends.items()
+        }
+
+    def get_status(self, eventtime):
+        return self._status
+
+
+class PrinterSGP40:
+    def __init__(self, config):
+        self.printer = config.get_printer()
+        self.reactor = self.printer.get_reactor()
+        self.defer_self_test = config.getboolean("defer_self_test", False)
+        self._sensors = []
+        self._groups = {}
+        # Register sensor
+        pheaters = self.printer.load_object(config, "heaters")
+        pheaters.add_sensor_factory("SGP40", SGP40)
+
+        self.printer.register_event_handler("klippy:connect", self._handle_connect)
+        self.printer.register_event_handler("klippy:ready", self._handle_ready)
+
+    def add_sensor(self, sensor):
+        self._sensors.append(sensor)
+
+    def lookup_group(self, name):
+        if name not in self._groups:
+            self._groups[name] = _SyncGroup(self.printer, name)
+        return self._groups[name]
+
+    def _resolve_sync_with(self):
+        for sensor in self._sensors:
+            if sensor._sync_with is None:
+                continue
+            peer = self.printer.lookup_object(
+                "sgp40 " + sensor._sync_with.split()[-1], None
+            )
+            if peer is None:
+                raise self.printer.config_error(
+                    "SGP40 %s: sync_with sensor '%s' not found"
+                    % (sensor.name, sensor._sync_with)
+                )
+            peer._group.merge(sensor._group)
+        for name, group in self._groups.items():
+            if len(group.members) < 2:
+                logging.warning("SGP40 sync group '%s' has only one sensor" % name)
+
+    def _handle_connect(self):
+        if not self._sensors:
+            return
+        self._resolve_sync_with()
+        for sensor in self._sensors:
+            sensor._handle_connect()
+        if self.defer_self_test:
+            return
+
+        # All sensors are initialized together so the waits are shared
+        # instead of adding up for every sensor.
+        #
+        # Intentionally no try/except: the sensors must respond at startup.
+        # Transient NACKs during the measurement loop are handled by the sync
+        # group step, but a sensor that is absent or unresponsive at connect
+        # time should be a hard failure.
+        for sensor in self._sensors:
+            sensor._stop_heater()
+        self._wait_ms(50)
+        for sensor in self._sensors:
+            sensor._start_self_test()
+        self._wait_ms(500)
+        for sensor in self._sensors:
+            sensor._check_self_test()
+            sensor._start()
+
+    def _handle_ready(self):
+        if self.defer_self_test and self._sensors:
+            self.reactor.register_callback(self._deferred_self_test)
+
+    def _deferred_self_test(self, eventtime):
+        # Past klippy:ready an unresponsive sensor is only logged; the
+        # measurement step keeps retrying it.
+        stopped = []
+        for sensor in self._sensors:
+            try:
+                sensor._stop_heater()
+                stopped.append(sensor)
+            except Exception:
+                logging.exception("SGP40 %s: Error stopping heater" % sensor.name)
+        self._wait_ms(50)
+        started = []
+        for sensor in stopped:
+            try:
+                sensor._start_self_test()
+                started.append(sensor)
+            except Exception:
+                logging.exception("SGP40 %s: Error starting self test" % sensor.name)
+        self._wait_ms(500)
+        for sensor in started:
+            try:
+                sensor._check_self_test()
+            except Exception:
+                logging.exception("SGP40 %s: Error reading self test" % sensor.name)
+        for sensor in self._sensors:
+            sensor._start()
+
+    def _wait_ms(self, ms):
+        self.reactor.pause(self.reactor.monotonic() + ms / 1000)
+
 
 def load_config(config):
-    # Register sensor
-    pheaters = config.get_printer().load_object(config, "heaters")
-    pheaters.add_sensor_factory("SGP40", SGP40)
+    return PrinterSGP40(config)
@@ -0,0 +1,75 @@
+from math import ceil
+
+
+class ExposureSummary:
+    """Constant-memory summary of VOC index exposure over a time window.
+
+    The VOC index is an integer between 0 and 500, so a fixed histogram gives
+    exact quantiles without storing individual samples.
+    """
+
+    _INDEX_MAX = 500
+    _QUANTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+
+    def __init__(self, threshold):
+        """
+        Args:
+            threshold: VOC index above which time is counted as exposure
+        """
+        self.threshold = threshold
+        self.reset()
+
+    def reset(self):
+        """Discard all accumulated samples."""
+        self._histogram = [0] * (self._INDEX_MAX + 1)
+        self._count = 0
+        self._peak = 0
+        self._duration = 0.0
+        self._time_above = 0.0
+        self._area = 0.0
+        self._last_time = None
+        self._last_index = 0
+        self._status = None
+
+    def update(self, eventtime, index):
+        """Add a VOC index sample taken at eventtime."""
+        index = max(0, min(self._INDEX_MAX, int(index)))
+        if self._last_time is not None:
+            dt = eventtime - self._last_time
+            self._duration += dt
+            self._area += self._last_index * dt
+            if self._last_index > self.threshold:
+                self._time_above += dt
+        self._last_time = eventtime
+        self._last_index = index
+        self._histogram[index] += 1
+        self._count += 1
+        self._peak = max(self._peak, index)
+        self._status = None
+
+    def _quantiles(self):
+        # Nearest-rank quantiles from a single cumulative pass.
+        if not self._count:
+            return {name: 0 for name, _ in self._QUANTILES}
+        result = {}
+        index = cumulative = 0
+        for name, q in self._QUANTILES:
+            rank = max(1, ceil(q * self._count))
+            while cumulative < rank:
+                cumulative += self._histogram[index]
+                index += 1
+            result[name] = index - 1
+        return result
+
+    def get_status(self):
+        """Return the summary, recomputing it only after new samples."""
+        if self._status is None:
+            self._status = {
+                "samples": self._count,
+                "duration": round(self._duration, 1),
+                "peak": self._peak,
+                "time_above_threshold": round(self._time_above, 1),
+                "area": round(self._area, 1),
+            }
+            self._status.update(self._quantiles())
+        return self._status
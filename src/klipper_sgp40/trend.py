@@ -0,0 +1,93 @@
+from collections import deque
+
+
+class RollingWindow:
+    """Mean, extremes and slope of samples over a sliding time window.
+
+    Updates are O(1) amortized: running sums give the mean and least squares
+    slope, and monotonic deques give the minimum and maximum.
+    """
+
+    def __init__(self, duration):
+        """
+        Args:
+            duration: Length of the window (seconds)
+        """
+        self.duration = duration
+        self.reset()
+
+    def reset(self):
+        """Discard all samples in the window."""
+        self._samples = deque()
+        self._minima = deque()
+        self._maxima = deque()
+        self._origin = 0.0
+        self._sum_t = self._sum_tt = self._sum_v = self._sum_tv = 0.0
+        self._updates = 0
+
+    def update(self, eventtime, value):
+        """Add a sample taken at eventtime and drop samples that expired."""
+        self._samples.append((eventtime, value))
+        self._accumulate(eventtime, value, 1.0)
+        while self._minima and self._minima[-1][1] >= value:
+            self._minima.pop()
+        self._minima.append((eventtime, value))
+        while self._maxima and self._maxima[-1][1] <= value:
+            self._maxima.pop()
+        self._maxima.append((eventtime, value))
+
+        cutoff = eventtime - self.duration
+        while self._samples[0][0] <= cutoff:
+            self._accumulate(*self._samples.popleft(), -1.0)
+        while self._minima[0][0] <= cutoff:
+            self._minima.popleft()
+        while self._maxima[0][0] <= cutoff:
+            self._maxima.popleft()
+
+        # Recompute the sums once per window length, relative to the oldest
+        # sample, so rounding errors and large timestamps do not accumulate.
+        self._updates += 1
+        if self._updates >= len(self._samples):
+            self._rebase()
+
+    def _accumulate(self, eventtime, value, sign):
+        t = eventtime - self._origin
+        self._sum_t += sign * t
+        self._sum_tt += sign * t * t
+        self._sum_v += sign * value
+        self._sum_tv += sign * t * value
+
+    def _rebase(self):
+        self._origin = self._samples[0][0]
+        self._sum_t = self._sum_tt = self._sum_v = self._sum_tv = 0.0
+        for eventtime, value in self._samples:
+            self._accumulate(eventtime, value, 1.0)
+        self._updates = 0
+
+    @property
+    def span(self):
+        """Time between the oldest and newest sample (seconds)."""
+        if not self._samples:
+            return 0.0
+        return self._samples[-1][0] - self._samples[0][0]
+
+    @property
+    def slope(self):
+        """Least squares slope of the samples (change per minute)."""
+        count = len(self._samples)
+        denominator = count * self._sum_tt - self._sum_t * self._sum_t
+        if count < 2 or denominator <= 0.0:
+            return 0.0
+        return 60.0 * (count * self._sum_tv - self._sum_t * self._sum_v) / denominator
+
+    def get_status(self):
+        count = len(self._samples)
+        if not count:
+            return {"mean": 0.0, "min": 0, "max": 0, "slope": 0.0}
+        return {
+            "mean": round(self._sum_v / count, 1),
+            "min": self._minima[0][1],
+            "max": self._maxima[0][1],
+            # VOC index change per minute
+            "slope": round(self.slope, 2),
+        }
@@ -0,0 +1,101 @@
+import logging
+
+from .trend import RollingWindow
+
+
+class VocTrigger:
+    """Threshold trigger on the VOC index with hysteresis and hold time.
+
+    Actions only run on state transitions, outside of the measurement step.
+    """
+
+    def __init__(self, config, name):
+        self.printer = config.get_printer()
+        self.reactor = self.printer.get_reactor()
+        self.name = name
+        self.rising = config.getfloat("trigger_rising", minval=0.0, maxval=500.0)
+        self.falling = config.getfloat(
+            "trigger_falling", self.rising, minval=0.0, maxval=self.rising
+        )
+        self.rate = config.getfloat("trigger_rate", None, above=0.0)
+        self._rate_window = RollingWindow(
+            config.getfloat("trigger_rate_window", 60.0, minval=10.0)
+        )
+        self.hold_time = config.getfloat("trigger_hold_time", 0.0, minval=0.0)
+        gcode_macro = self.printer.load_object(config, "gcode_macro")
+        self._rising_template = gcode_macro.load_template(
+            config, "trigger_rising_gcode", ""
+        )
+        self._falling_template = gcode_macro.load_template(
+            config, "trigger_falling_gcode", ""
+        )
+        self.fan = config.get("trigger_fan", None)
+        self.fan_speed = config.getfloat(
+            "trigger_fan_speed", 1.0, minval=0.0, maxval=1.0
+        )
+        self.active = False
+        self._pending_time = None
+
+        if self.printer.get_start_args().get("debugoutput") is None:
+            self.printer.register_event_handler("klippy:connect", self._handle_connect)
+
+    def _handle_connect(self):
+        if self.fan is None:
+            return
+        if self.printer.lookup_object("fan_generic " + self.fan, None) is None:
+            raise self.printer.config_error(
+                "SGP40 %s: trigger_fan '%s' is not a fan_generic"
+                % (self.name, self.fan)
+            )
+
+    def update(self, eventtime, index):
+        """Evaluate a new VOC index sample.
+
+        Returns:
+            True if the trigger changed state
+        """
+        if not index:
+            # The gas index algorithm reports zero until it has warmed up.
+            self._pending_time = None
+            self._rate_window.reset()
+            return False
+        rate_met = False
+        if self.rate is not None:
+            # Least squares slope over the window; the slope of an integer
+            # index between two samples is far too coarse and noisy.
+            window = self._rate_window
+            window.update(eventtime, index)
+            if window.span >= window.duration / 2:
+                rate_met = window.slope >= self.rate
+
+        if self.active:
+            # Strictly below, so an index sitting at the rising level with
+            # the default falling level does not toggle on every sample.
+            condition = index < self.falling and not rate_met
+        else:
+            condition = index >= self.rising or rate_met
+        if not condition:
+            self._pending_time = None
+            return False
+        if self._pending_time is None:
+            self._pending_time = eventtime
+        if eventtime - self._pending_time < self.hold_time:
+            return False
+
+        self._pending_time = None
+        self.active = not self.active
+        active = self.active
+        self.reactor.register_callback(lambda e: self._run_actions(active))
+        return True
+
+    def _run_actions(self, active):
+        gcode = self.printer.lookup_object("gcode")
+        template = self._rising_template if active else self._falling_template
+        try:
+            script = template.render()
+            if self.fan is not None:
+                speed = self.fan_speed if active else 0.0
+                script += "\nSET_FAN_SPEED FAN=%s SPEED=%.3f" % (self.fan, speed)
+            gcode.run_script(script)
+        except Exception:
+            logging.exception("SGP40 %s: Error running trigger G-Code" % self.name)
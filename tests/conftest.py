@@ -0,0 +1,9 @@
+import sys
+import types
+from pathlib import Path
+
+# The package is a Klipper extra and its __init__ imports Klipper's bus
+# module, so expose the pure submodules without running it.
+_package = types.ModuleType("klipper_sgp40")
+_package.__path__ = [str(Path(__file__).parent.parent / "src" / "klipper_sgp40")]
+sys.modules.setdefault("klipper_sgp40", _package)
@@ -0,0 +1,27 @@
+from klipper_sgp40.exposure import ExposureSummary
+
+
+def test_empty_summary():
+    status = ExposureSummary(250).get_status()
+    assert status["samples"] == 0
+    assert status["p50"] == status["p95"] == status["p99"] == 0
+
+
+def test_quantiles_and_accumulators():
+    exposure = ExposureSummary(250)
+    for i, index in enumerate([100] * 90 + [300] * 9 + [450]):
+        exposure.update(float(i), index)
+    status = exposure.get_status()
+    assert status["samples"] == 100
+    assert status["peak"] == 450
+    assert (status["p50"], status["p95"], status["p99"]) == (100, 300, 300)
+    assert status["duration"] == 99.0
+    assert status["time_above_threshold"] == 9.0
+    assert status["area"] == 90 * 100 + 9 * 300
+
+
+def test_reset():
+    exposure = ExposureSummary(250)
+    exposure.update(0.0, 400)
+    exposure.reset()
+    assert exposure.get_status()["peak"] == 0
@@ -0,0 +1,82 @@
+from klipper_sgp40.trigger import VocTrigger
+
+
+class _Reactor:
+    def __init__(self):
+        self.callbacks = []
+
+    def register_callback(self, callback):
+        self.callbacks.append(callback)
+
+
+class _Printer:
+    def __init__(self):
+        self.reactor = _Reactor()
+
+    def get_reactor(self):
+        return self.reactor
+
+    def get_start_args(self):
+        return {}
+
+    def register_event_handler(self, event, callback):
+        pass
+
+    def load_object(self, config, name):
+        return _GCodeMacro()
+
+
+class _GCodeMacro:
+    def load_template(self, config, option, default=None):
+        return None
+
+
+class _Config:
+    def __init__(self, **options):
+        self.printer = _Printer()
+        self.options = options
+
+    def get_printer(self):
+        return self.printer
+
+    def get(self, option, default=None):
+        return self.options.get(option, default)
+
+    def getfloat(self, option, default=None, **kwargs):
+        value = self.options.get(option, default)
+        return None if value is None else float(value)
+
+
+def _transitions(trigger, samples):
+    return [i for i, index in enumerate(samples) if trigger.update(float(i), index)]
+
+
+def test_rising_and_falling_with_hysteresis():
+    trigger = VocTrigger(_Config(trigger_rising=200, trigger_falling=150), "x")
+    samples = [100, 199, 200, 250, 160, 150, 149, 180]
+    assert _transitions(trigger, samples) == [2, 6]
+    assert not trigger.active
+
+
+def test_index_at_rising_level_does_not_toggle():
+    trigger = VocTrigger(_Config(trigger_rising=200), "x")
+    assert _transitions(trigger, [200] * 10) == [0]
+    assert trigger.active
+    assert _transitions(trigger, [199]) == [0]
+
+
+def test_hold_time():
+    trigger = VocTrigger(_Config(trigger_rising=200, trigger_hold_time=3), "x")
+    assert _transitions(trigger, [250, 250, 100, 250, 250, 250, 250]) == [6]
+
+
+def test_rate_uses_windowed_slope():
+    trigger = VocTrigger(
+        _Config(trigger_rising=400, trigger_rate=15, trigger_hold_time=10), "x"
+    )
+    # Single sample jitter does not trigger, a steady 20/min rise does.
+    assert _transitions(trigger, [100, 101] * 60) == []
+    trigger = VocTrigger(
+        _Config(trigger_rising=400, trigger_rate=15, trigger_hold_time=10), "x"
+    )
+    assert _transitions(trigger, [100 + i // 3 for i in range(120)]) == [40]